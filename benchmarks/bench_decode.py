@@ -0,0 +1,79 @@
+# Benchmark: bulk decoding engine vs. the original per-cell struct.unpack loop.
+#
+# Usage: python benchmarks/bench_decode.py [--repeat N]
+#
+# The legacy_* functions below are verbatim copies of the loops that used to live
+# in analyze_dynamic_map / parse_axis_values; every run also asserts that the new
+# engine produces identical output.
+import argparse
+import os
+import random
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import decode_map_block, parse_axis_values  # noqa: E402
+
+
+def legacy_decode_map_block(raw_block, rows, cols, data_type, endian, factor, offset_val, unit):
+    byte_per_value = 2 if data_type == "16bit" else 1
+    map_data = []
+    for i in range(rows):
+        row = []
+        for j in range(cols):
+            start_idx = (i * cols + j) * byte_per_value
+            end_idx = start_idx + byte_per_value
+            if data_type == "8bit":
+                raw_value = raw_block[start_idx]
+            else:
+                raw_value = struct.unpack(endian, raw_block[start_idx:end_idx])[0]
+            processed_value = raw_value * factor + offset_val
+            if unit in ["bar", "mbar", "% duty"] and processed_value < 0:
+                processed_value = 0
+            row.append(round(processed_value, 2))
+        map_data.append(row)
+    return map_data
+
+
+def legacy_parse_axis_values(raw_bytes, scale, data_type="8bit", endian=None):
+    values = []
+    bytes_per_axis_value = 2 if data_type == "16bit" else 1
+    for i in range(0, len(raw_bytes), bytes_per_axis_value):
+        if data_type == "8bit":
+            raw_value = raw_bytes[i]
+        else:
+            raw_value = struct.unpack(endian, raw_bytes[i:i + bytes_per_axis_value])[0]
+        values.append(round(raw_value * scale, 2))
+    return values
+
+
+def run(repeat):
+    rng = random.Random(1984)
+    print(f"{'map':<18}{'legacy (us)':>14}{'bulk (us)':>12}{'speedup':>10}")
+    for data_type, endian in (("8bit", None), ("16bit", ">H"), ("16bit", "<H")):
+        for size in (8, 16, 32, 64):
+            width = 2 if data_type == "16bit" else 1
+            raw_block = bytes(rng.getrandbits(8) for _ in range(size * size * width))
+            args = (raw_block, size, size, data_type, endian, 0.01, -5.0)
+
+            expected = legacy_decode_map_block(*args, "bar")
+            assert decode_map_block(*args, True) == expected, "decode mismatch"
+
+            legacy = min(timeit.repeat(lambda: legacy_decode_map_block(*args, "bar"), number=20, repeat=repeat)) / 20
+            bulk = min(timeit.repeat(lambda: decode_map_block(*args, True), number=20, repeat=repeat)) / 20
+            label = f"{size}x{size} {data_type} {endian or ''}"
+            print(f"{label:<18}{legacy * 1e6:>14.1f}{bulk * 1e6:>12.1f}{legacy / bulk:>9.1f}x")
+
+    axis_bytes = bytes(rng.getrandbits(8) for _ in range(128))
+    assert parse_axis_values(axis_bytes, 0.5, "16bit", ">H") == legacy_parse_axis_values(axis_bytes, 0.5, "16bit", ">H")
+    legacy = min(timeit.repeat(lambda: legacy_parse_axis_values(axis_bytes, 0.5, "16bit", ">H"), number=200, repeat=repeat)) / 200
+    bulk = min(timeit.repeat(lambda: parse_axis_values(axis_bytes, 0.5, "16bit", ">H"), number=200, repeat=repeat)) / 200
+    print(f"{'axis 64 16bit >H':<18}{legacy * 1e6:>14.1f}{bulk * 1e6:>12.1f}{legacy / bulk:>9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    run(parser.parse_args().repeat)
@@ -0,0 +1,40 @@
+# Benchmark: bulk map encoder vs. the original per-cell save_tuned_bin loop.
+#
+# Usage: python benchmarks/bench_encode.py [--repeat N]
+#
+# legacy_encode_block is the copy of the loop that used to live in save_tuned_bin kept in
+# tests/test_encode.py, which checks that both produce byte-identical blocks.
+import argparse
+import os
+import random
+import sys
+import timeit
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "tests"))
+
+from main import encode_map_block  # noqa: E402
+from test_encode import legacy_encode_block  # noqa: E402
+
+
+def run(repeat):
+    rng = random.Random(7)
+    print(f"{'map':<18}{'legacy (us)':>14}{'bulk (us)':>12}{'speedup':>10}")
+    for data_type, endian in (("8bit", None), ("16bit", ">H"), ("16bit", "<H")):
+        for size in (8, 16, 32, 64):
+            width = 2 if data_type == "16bit" else 1
+            values = [rng.uniform(0, 300) for _ in range(size * size)]
+            original_block = bytes(size * size * width)
+            args = (values, original_block, data_type, endian, 0.1, -10)
+            legacy = min(timeit.repeat(lambda: legacy_encode_block(*args), number=20, repeat=repeat)) / 20
+            bulk = min(timeit.repeat(lambda: encode_map_block(*args), number=20, repeat=repeat)) / 20
+            label = f"{size}x{size} {data_type} {endian or ''}"
+            print(f"{label:<18}{legacy * 1e6:>14.1f}{bulk * 1e6:>12.1f}{legacy / bulk:>9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.repeat)
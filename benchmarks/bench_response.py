@@ -0,0 +1,74 @@
+# Benchmark: /analyze response encoding, JSON vs. the binary float32 format.
+#
+# Usage: python benchmarks/bench_response.py [--repeat N]
+#
+# Times serializing a decoded map result (what a result cache miss pays on top of
+# decoding), parsing it back (json.loads vs. np.frombuffer, standing in for the
+# browser's JSON.parse vs. Float32Array views) and the payload size, raw and
+# gzip-compressed (as sent behind a compressing proxy). Every run also decodes the
+# binary body and checks it against the JSON values.
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import (  # noqa: E402
+    ECU_MAP_HEADER,
+    analyze_map,
+    encode_map_result_binary,
+    encode_map_result_json,
+)
+
+
+def decode_binary(body):
+    _, _, _, rows, cols, meta_length = ECU_MAP_HEADER.unpack_from(body)
+    arrays = ECU_MAP_HEADER.size + meta_length
+    values = np.frombuffer(body, dtype="<f4", offset=arrays)
+    return json.loads(body[ECU_MAP_HEADER.size:arrays]), values[:cols], values[cols:cols + rows], values[cols + rows:].reshape(rows, cols)
+
+
+def check_binary(result, body):
+    meta, x_axis, y_axis, map_data = decode_binary(body)
+    assert meta["type"] == result["type"]
+    for expected, actual in ((result["x_axis"], x_axis), (result["y_axis"], y_axis), (sum(result["map"], []), map_data.ravel())):
+        assert np.allclose(np.array(expected, dtype=float), actual, rtol=1e-6, atol=5e-3, equal_nan=True)
+
+
+def run(repeat):
+    rng = random.Random(1984)
+    print(f"{'map':<18}{'encode json/bin (us)':>22}{'parse json/bin (us)':>21}{'json B':>9}{'binary B':>10}{'json gz':>9}{'bin gz':>8}")
+    for data_type, endian, factor, offset_val in (("8bit", None, 1, 0), ("16bit", ">H", 0.01, -5.0)):
+        for size in (8, 16, 32, 64):
+            width = 2 if data_type == "16bit" else 1
+            content = bytes(rng.getrandbits(8) for _ in range(size * size * width + 2 * size * width))
+            map_def = {
+                "name": "bench", "unit": "mg", "block": 2 * size * width, "rows": size, "cols": size,
+                "dataType": data_type, "endian": endian, "factor": factor, "offset": offset_val,
+                "xAxisOffset": 0, "yAxisOffset": size * width, "xAxisDataType": data_type, "yAxisDataType": data_type,
+                "xScale": 0.25, "yScale": 10,
+            }
+            result = analyze_map(content, map_def)
+            json_body = encode_map_result_json(result)
+            binary_body = encode_map_result_binary(result)
+            check_binary(result, binary_body)
+
+            json_us = min(timeit.repeat(lambda: encode_map_result_json(result), number=repeat, repeat=3)) / repeat * 1e6
+            binary_us = min(timeit.repeat(lambda: encode_map_result_binary(result), number=repeat, repeat=3)) / repeat * 1e6
+            json_parse_us = min(timeit.repeat(lambda: json.loads(json_body), number=repeat, repeat=3)) / repeat * 1e6
+            binary_parse_us = min(timeit.repeat(lambda: decode_binary(binary_body), number=repeat, repeat=3)) / repeat * 1e6
+            label = f"{data_type} {size}x{size}"
+            print(f"{label:<18}{json_us:>11.1f} /{binary_us:>8.1f}{json_parse_us:>11.1f} /{binary_parse_us:>7.1f}"
+                  f"{len(json_body):>9}{len(binary_body):>10}{len(gzip.compress(json_body)):>9}{len(gzip.compress(binary_body)):>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=200)
+    run(parser.parse_args().repeat)
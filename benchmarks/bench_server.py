@@ -0,0 +1,124 @@
+# Load test against a running server (dev server or gunicorn) over real HTTP.
+#
+# Usage:
+#   python main.py &                                   # or: gunicorn -c gunicorn.conf.py main:app &
+#   python benchmarks/bench_server.py --url http://127.0.0.1:10000 --clients 16 --requests 400
+#
+# Uploads one synthetic BIN through /upload_bin, then hammers /analyze on its bin_id
+# from --clients threads and reports requests/s and latency percentiles.
+# --background-scans N keeps N full-image /scan_maps requests running meanwhile, to
+# show how well the server keeps answering small requests next to heavy ones.
+import argparse
+import json
+import os
+import random
+import statistics
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+
+def build_bin(size, seed=1984):
+    return random.Random(seed).randbytes(size)
+
+
+def post_multipart(url, fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    request = urllib.request.Request(url, data=b"".join(parts), method="POST",
+                                     headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+def run(url, clients, total_requests, bin_size, map_size, background_scans=0):
+    content = build_bin(bin_size)
+    bin_id = post_multipart(f"{url}/upload_bin", {}, {"bin": ("bench.bin", content)})["bin_id"]
+    map_def = {"name": "rail_pressure", "block": 0x1000, "rows": map_size, "cols": map_size, "dataType": "16bit",
+               "endian": ">H", "factor": 0.1, "offset": 0, "xAxisOffset": 0x100, "yAxisOffset": 0x200}
+    body = urllib.parse.urlencode({"bin_id": bin_id, "custom_map_definition": json.dumps(map_def)}).encode()
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    remaining = [total_requests]
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(urllib.request.Request(f"{url}/analyze", data=body, method="POST")) as response:
+                    response.read()
+            except Exception as e:  # noqa: BLE001 - report and keep going
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    done = threading.Event()
+    scans = [0]
+
+    def scanner():
+        scan_body = urllib.parse.urlencode({"bin_id": bin_id}).encode()
+        while not done.is_set():
+            with urllib.request.urlopen(urllib.request.Request(f"{url}/scan_maps", data=scan_body, method="POST")) as response:
+                response.read()
+            scans[0] += 1
+
+    scanners = [threading.Thread(target=scanner, daemon=True) for _ in range(background_scans)]
+    for thread in scanners:
+        thread.start()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+
+    latencies.sort()
+    result = {
+        "url": url,
+        "clients": clients,
+        "background_scans": background_scans,
+        "scans_completed": scans[0],
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+    }
+    print(json.dumps(result))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default=os.environ.get("BENCH_URL", "http://127.0.0.1:10000"))
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--bin-size", type=int, default=4 * 1024 * 1024)
+    parser.add_argument("--map-size", type=int, default=32)
+    parser.add_argument("--background-scans", type=int, default=0)
+    args = parser.parse_args()
+    run(args.url.rstrip("/"), args.clients, args.requests, args.bin_size, args.map_size, args.background_scans)
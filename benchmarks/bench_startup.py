@@ -0,0 +1,128 @@
+# Cold-start measurement: how long a freshly started process takes to answer, and whether
+# its first /analyze is slower than the second.
+#
+# Usage:
+#   python benchmarks/bench_startup.py                          # fresh interpreters + Flask test client
+#   python benchmarks/bench_startup.py --server                 # gunicorn -c gunicorn.conf.py main:app, over HTTP
+#   python benchmarks/bench_startup.py --server --health-first  # wake-up ping to /health before /analyze
+#
+# Every run starts a new process (--runs, default 5) and reports medians:
+#   import        python start -> `import main` done (in-process mode only)
+#   listening     process start -> port accepting connections (--server only)
+#   first resp    process start -> first /analyze answered
+#   analyze 1/2   latency of the first and the second /analyze (1 MB upload, 32x32 16-bit map)
+# The app's own numbers (startup section of /health) are printed for the last run.
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_server import build_bin, post_multipart  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BIN_SIZE = 1024 * 1024
+MAP_DEF = {"name": "rail_pressure", "block": 0x1000, "rows": 32, "cols": 32, "dataType": "16bit",
+           "endian": ">H", "factor": 0.1, "offset": 0, "xAxisOffset": 0x100, "yAxisOffset": 0x200}
+
+# Runs in a fresh interpreter; prints one JSON line with its timings
+CHILD = """
+import time
+started = time.perf_counter()
+import io, json, sys
+sys.path.insert(0, {repo!r})
+import main
+imported = time.perf_counter()
+sys.path.insert(0, {benchmarks!r})
+from bench_server import build_bin
+client = main.app.test_client()
+import flask.testing, werkzeug.test  # test client machinery, not part of the app's cold start
+timings = {{"import": imported - started}}
+if {health_first!r}:
+    request_started = time.perf_counter()
+    client.get("/health")
+    timings["health"] = time.perf_counter() - request_started
+content = build_bin({bin_size})
+for attempt in (1, 2):
+    request_started = time.perf_counter()
+    response = client.post("/analyze", data={{"bin": (io.BytesIO(content), "bench.bin"), "custom_map_definition": {map_def!r}}})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    timings[f"analyze_{{attempt}}"] = time.perf_counter() - request_started
+    if attempt == 1:
+        timings["first_response"] = time.perf_counter() - started
+timings["app"] = client.get("/health").get_json().get("startup")
+print(json.dumps(timings))
+"""
+
+
+def run_in_process(health_first):
+    code = CHILD.format(repo=REPO_DIR, benchmarks=os.path.join(REPO_DIR, "benchmarks"), health_first=health_first, bin_size=BIN_SIZE, map_def=json.dumps(MAP_DEF))
+    env = dict(os.environ, JOB_WORKERS="0")
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_server(health_first):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    content = build_bin(BIN_SIZE)
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY="1", APP_ENV="production", GUNICORN_LOG_LEVEL="warning")
+    started = time.perf_counter()
+    server = subprocess.Popen(["gunicorn", "-c", "gunicorn.conf.py", "main:app"], cwd=REPO_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if server.poll() is not None or time.perf_counter() - started > 30:
+                    raise RuntimeError("server did not start")
+                time.sleep(0.005)
+        timings = {"listening": time.perf_counter() - started}
+        if health_first:
+            request_started = time.perf_counter()
+            urllib.request.urlopen(f"{url}/health").read()
+            timings["health"] = time.perf_counter() - request_started
+        for attempt in (1, 2):
+            request_started = time.perf_counter()
+            post_multipart(f"{url}/analyze", {"custom_map_definition": json.dumps(MAP_DEF)}, {"bin": ("bench.bin", content)})
+            timings[f"analyze_{attempt}"] = time.perf_counter() - request_started
+            if attempt == 1:
+                timings["first_response"] = time.perf_counter() - started
+        timings["app"] = json.loads(urllib.request.urlopen(f"{url}/health").read()).get("startup")
+        return timings
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run(runs, server, health_first):
+    results = [(run_server if server else run_in_process)(health_first) for _ in range(runs)]
+    columns = [key for key in ("import", "listening", "health", "first_response", "analyze_1", "analyze_2") if key in results[0]]
+    print(f"{runs} cold starts ({'gunicorn over HTTP' if server else 'test client'}{', /health first' if health_first else ''}), median ms:")
+    for key in columns:
+        values = [result[key] * 1000 for result in results]
+        print(f"  {key:<15}{statistics.median(values):>9.1f}   (min {min(values):.1f}, max {max(values):.1f})")
+    print(f"  app startup (last run): {results[-1]['app']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--server", action="store_true", help="start gunicorn and measure over HTTP")
+    parser.add_argument("--health-first", action="store_true", help="call /health (warm-up) before the first /analyze")
+    args = parser.parse_args()
+    run(args.runs, args.server, args.health_first)
@@ -0,0 +1,289 @@
+# Benchmark suite: micro-benchmarks of the decode/encode engine plus an end-to-end load
+# test through Flask's test client, with a stored baseline to catch regressions.
+#
+# Usage:
+#   python benchmarks/bench_suite.py                       # run, compare with benchmarks/baseline.json
+#   python benchmarks/bench_suite.py --quick               # fewer sizes/iterations (smoke run)
+#   python benchmarks/bench_suite.py --save-baseline       # run and overwrite the baseline
+#   python benchmarks/bench_suite.py --tolerance 1.0       # allowed slowdown before failing (default 0.5);
+#                                                          # raise it on shared/noisy hosts
+#
+# Synthetic BIN images (1, 3 and 6 MB of seeded random bytes) carry one map per
+# combination of data type/endianness (8bit, 16bit big endian, 16bit little endian) and
+# size (8x8, 16x16, 32x32, 64x64), each with increasing X/Y axes in front of it.
+#
+# micro: parse_axis_values, analyze_map (what /analyze runs per map), encode_map_block
+#        (what /save_tuned_bin runs) and resample_map_values (bicubic, axes stretched by 10%),
+#        best-of-N microseconds per call
+# e2e:   requests through the test client (no network): requests/s, p50/p99 latency and
+#        the process' peak RSS after each scenario
+#
+# Timings depend on the machine: re-save the baseline when moving to other hardware. A fixed
+# calibration workload is timed in every run and baseline figures are scaled by its ratio, so a
+# host that is uniformly slower today isn't reported as a regression. The exit status is 1 when
+# a result is slower than the scaled baseline * (1 + tolerance).
+# Logging below ERROR is switched off while measuring (its cost depends on the log sink).
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import time
+import timeit
+
+import numpy as np
+
+os.environ.setdefault("JOB_WORKERS", "0") # keep /jobs-backed endpoints in-process
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from main import analyze_map, encode_map_block, parse_axis_values, resample_map_values  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+LAYOUTS = (("8bit", None), ("16bit", ">H"), ("16bit", "<H"))
+MAP_SIZES = (8, 16, 32, 64)
+BIN_SIZES = (1_000_000, 3_000_000, 6_000_000) # decimal MB: 6 MB plus form overhead fits MAX_CONTENT_LENGTH
+
+
+def map_label(data_type, endian, size):
+    return f"{data_type}{'_be' if endian == '>H' else '_le' if endian == '<H' else ''}_{size}x{size}"
+
+
+def build_bin(size, map_sizes=MAP_SIZES, seed=1984):
+    # Random image with one smooth map (and its axes) per layout/size, 16-byte aligned from 0x1000
+    rng = np.random.default_rng(seed)
+    image = bytearray(rng.integers(0, 256, size, dtype=np.uint8).tobytes())
+    definitions = []
+    position = 0x1000
+    for data_type, endian in LAYOUTS:
+        dtype = np.dtype(np.uint8) if data_type == "8bit" else np.dtype(endian.replace("H", "u2"))
+        top = 250 if data_type == "8bit" else 60000
+        for n in map_sizes:
+            x_axis = np.linspace(top * 0.05, top * 0.9, n).astype(dtype)
+            y_axis = np.linspace(top * 0.02, top * 0.5, n).astype(dtype)
+            # Raw values start above -offset/factor so the "bar" clamp doesn't change them
+            grid = np.add.outer(np.arange(n), np.arange(n)) * (top * 0.8 / (2 * n)) + top * 0.1
+            map_data = (grid + rng.integers(0, 3, (n, n))).astype(dtype)
+            x_offset = position
+            y_offset = x_offset + x_axis.nbytes
+            block = y_offset + y_axis.nbytes
+            image[x_offset:block + map_data.nbytes] = x_axis.tobytes() + y_axis.tobytes() + map_data.tobytes()
+            definitions.append({
+                "name": map_label(data_type, endian, n),
+                "block": block, "rows": n, "cols": n,
+                "dataType": data_type, "endian": endian,
+                "factor": 0.5 if data_type == "8bit" else 0.01, "offset": -10, "unit": "bar",
+                "xAxisOffset": x_offset, "yAxisOffset": y_offset, "xScale": 1, "yScale": 0.1,
+            })
+            position = (block + map_data.nbytes + 15) // 16 * 16
+    return bytes(image), definitions
+
+
+def best_us(func, repeat):
+    # Minimum over repeats: the least noisy estimate on a shared machine
+    number = timeit.Timer(func).autorange()[0]
+    return round(min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6, 2)
+
+
+def calibrate(repeat):
+    # Fixed interpreter + numpy workload independent of main.py: its ratio to the baseline's
+    # figure says how fast the host is running today, and scales the comparison
+    data = bytes(range(256)) * 64
+    def workload():
+        values = [byte * 0.5 - 10 for byte in data[:4096]]
+        np.frombuffer(data, dtype=">u2").astype(np.float64).sum()
+        return json.dumps(values)
+    return best_us(workload, repeat)
+
+
+def run_micro(map_sizes, repeat):
+    content, definitions = build_bin(BIN_SIZES[0], map_sizes)
+    results = {}
+    for map_def in definitions:
+        label = map_def["name"]
+        n, data_type, endian = map_def["rows"], map_def["dataType"], map_def["endian"]
+        width = 1 if data_type == "8bit" else 2
+        axis_bytes = content[map_def["xAxisOffset"]:map_def["xAxisOffset"] + n * width]
+        result = analyze_map(content, map_def)
+        values = [value for row in result["map"] for value in row]
+        original_block = content[map_def["block"]:map_def["block"] + n * n * width]
+        new_x_axis = [value * 1.1 for value in result["x_axis"]]
+        new_y_axis = [value * 1.1 for value in result["y_axis"]]
+
+        results[f"parse_axis_values/{label}"] = best_us(lambda: parse_axis_values(axis_bytes, 0.1, data_type, endian), repeat)
+        results[f"analyze_map/{label}"] = best_us(lambda: analyze_map(content, map_def), repeat)
+        results[f"encode_map_block/{label}"] = best_us(lambda: encode_map_block(values, original_block, data_type, endian, map_def["factor"], map_def["offset"]), repeat)
+        results[f"resample_map_values/{label}"] = best_us(lambda: resample_map_values(result["map"], result["x_axis"], result["y_axis"], new_x_axis, new_y_axis, "bicubic"), repeat)
+        assert encode_map_block(values, original_block, data_type, endian, map_def["factor"], map_def["offset"]).block == original_block, f"round trip failed for {label}"
+    return results
+
+
+def peak_rss_mb():
+    # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def measure(client, requests, make_request):
+    latencies = []
+    started = time.perf_counter()
+    for i in range(requests):
+        request_started = time.perf_counter()
+        response = make_request(i)
+        latencies.append(time.perf_counter() - request_started)
+        assert response.status_code == 200, f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}"
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_e2e(bin_sizes, map_sizes, requests):
+    client = main.app.test_client()
+    results = {}
+    for bin_size in bin_sizes:
+        content, definitions = build_bin(bin_size, map_sizes)
+        size_label = f"{bin_size // 1_000_000}MB"
+        bin_id = client.post("/upload_bin", data={"bin": (io.BytesIO(content), "bench.bin")}).get_json()["bin_id"]
+        largest = max(definitions, key=lambda map_def: map_def["rows"] * (2 if map_def["dataType"] == "16bit" else 1))
+        largest_json = json.dumps(largest)
+        modified = json.dumps(analyze_map(content, largest)["map"])
+
+        def analyze_upload(i):
+            return client.post("/analyze", data={"bin": (io.BytesIO(content), "bench.bin"), "custom_map_definition": largest_json})
+
+        def analyze_bin_id(i):
+            return client.post("/analyze", data={"bin_id": bin_id, "custom_map_definition": largest_json})
+
+        def analyze_binary(i):
+            return client.post("/analyze", data={"bin_id": bin_id, "custom_map_definition": largest_json, "format": "binary"})
+
+        def analyze_batch(i):
+            return client.post("/analyze_batch", data={"bin_id": bin_id, "map_definitions": json.dumps(definitions)})
+
+        def save_tuned_bin(i):
+            return client.post("/save_tuned_bin", data={"bin_id": bin_id, "custom_map_definition": largest_json, "modified_map_data": modified})
+
+        result_cache_max = main.map_result_cache.max_bytes
+        scenarios = (
+            # (name, request, result cache enabled)
+            ("analyze_upload", analyze_upload, False),
+            ("analyze_bin_id", analyze_bin_id, False),
+            ("analyze_bin_id_cached", analyze_bin_id, True),
+            ("analyze_binary", analyze_binary, False),
+            ("analyze_batch", analyze_batch, False),
+            ("save_tuned_bin", save_tuned_bin, False),
+        )
+        for name, make_request, cached in scenarios:
+            main.map_result_cache.max_bytes = result_cache_max if cached else 0
+            make_request(-1) # warm up (and fill the result cache when enabled)
+            count = requests if name != "analyze_upload" else max(5, requests // 5)
+            results[f"{name}/{size_label}"] = measure(client, count, make_request)
+        main.map_result_cache.max_bytes = result_cache_max
+    return results
+
+
+MICRO_MIN_DELTA_US = 5 # sub-5us swings on the smallest calls are scheduler noise, not regressions
+
+def host_speed_ratio(current, baseline):
+    # > 1: this run's host is slower than the baseline's (same code, same workload)
+    now, then = current["meta"].get("calibration_us"), baseline.get("meta", {}).get("calibration_us")
+    return now / then if now and then else 1.0
+
+
+# Regressions: times (micro, e2e p50) above baseline * speed ratio * (1 + tolerance), or e2e req/s
+# below baseline / speed ratio / (1 + tolerance)
+def compare(current, baseline, tolerance):
+    regressions = []
+    ratio = host_speed_ratio(current, baseline)
+    for key, value in current["micro"].items():
+        old = baseline.get("micro", {}).get(key)
+        if old:
+            old = round(old * ratio, 2)
+        if old and value > old * (1 + tolerance) and value - old >= MICRO_MIN_DELTA_US:
+            regressions.append(f"micro {key}: {old} -> {value} us ({value / old - 1:+.0%})")
+    for key, value in current["e2e"].items():
+        old = baseline.get("e2e", {}).get(key)
+        if not old:
+            continue
+        old = {"p50_ms": round(old["p50_ms"] * ratio, 3), "rps": round(old["rps"] / ratio, 1)}
+        if value["p50_ms"] > old["p50_ms"] * (1 + tolerance):
+            regressions.append(f"e2e {key}: p50 {old['p50_ms']} -> {value['p50_ms']} ms ({value['p50_ms'] / old['p50_ms'] - 1:+.0%})")
+        if value["rps"] < old["rps"] / (1 + tolerance):
+            regressions.append(f"e2e {key}: {old['rps']} -> {value['rps']} req/s ({value['rps'] / old['rps'] - 1:+.0%})")
+    return regressions
+
+
+def print_results(results, baseline):
+    print(f"{'micro benchmark':<40}{'us':>10}{'baseline':>10}")
+    for key, value in results["micro"].items():
+        old = baseline.get("micro", {}).get(key, "")
+        print(f"{key:<40}{value:>10}{old:>10}")
+    print()
+    print(f"{'end-to-end (test client)':<32}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'RSS MB':>8}{'base req/s':>12}{'base p50':>10}")
+    for key, value in results["e2e"].items():
+        old = baseline.get("e2e", {}).get(key, {})
+        print(f"{key:<32}{value['rps']:>9}{value['p50_ms']:>9}{value['p99_ms']:>9}{value['peak_rss_mb']:>8}{old.get('rps', ''):>12}{old.get('p50_ms', ''):>10}")
+
+
+def run(args):
+    logging.disable(logging.WARNING)
+    map_sizes = (8, 32) if args.quick else MAP_SIZES
+    bin_sizes = BIN_SIZES[:1] if args.quick else BIN_SIZES
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "quick": args.quick,
+            "date": time.strftime("%Y-%m-%d"),
+        },
+    }
+    calibration_before = calibrate(args.repeat)
+    results["micro"] = run_micro(map_sizes, args.repeat)
+    results["e2e"] = run_e2e(bin_sizes, map_sizes, args.requests)
+    results["meta"]["calibration_us"] = min(calibration_before, calibrate(args.repeat))
+    logging.disable(logging.NOTSET)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+    if not baseline:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one.")
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    print(f"\nHost speed vs baseline: x{host_speed_ratio(results, baseline):.2f} (calibration {results['meta']['calibration_us']} us)")
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        print("\n".join(f"  {regression}" for regression in regressions))
+        return 1
+    print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}.")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ECU analyzer benchmark suite")
+    parser.add_argument("--quick", action="store_true", help="fewer map/BIN sizes and requests")
+    parser.add_argument("--repeat", type=int, default=7, help="timing repeats per micro-benchmark")
+    parser.add_argument("--requests", type=int, default=200, help="requests per end-to-end scenario")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    sys.exit(run(parser.parse_args()))
@@ -0,0 +1,362 @@
+# Extract the same maps from many BIN files (e.g. an archive of ECU dumps for a
+# stock-vs-tuned audit) into one JSONL, CSV or Parquet output, using the decoder
+# behind /analyze.
+#
+# Usage:
+#   python extract_maps.py dumps/ --definitions maps.json -o audit.jsonl
+#   python extract_maps.py "archive/**/*.bin" --ecu-id 8E0909518AK --maps Boost,Timing -o audit.csv
+#   python extract_maps.py dumps/ --definitions maps.json -o audit_parquet --format parquet
+#   python extract_maps.py dumps/ --definitions maps.json -o audit.jsonl --resume   # after an interruption
+#
+# Inputs are BIN files, directories (searched recursively for --pattern, default *.bin) or globs.
+# --definitions is a JSON array of map definitions, a single definition or a registry file
+# ({"ecu_id": ..., "maps": [...]}); --ecu-id uses the maps registered in MAP_DEFINITIONS_DIR.
+#
+# Output layouts (--format, default from the output's extension):
+#   jsonl    one line per file and map: file, bin_id, map, display_name, unit, offset,
+#            x_axis, y_axis, values (rows x cols), error
+#   csv      one row per map cell: file, bin_id, map, row, col, x, y, value, error
+#            (a single row with the error for maps that couldn't be decoded)
+#   parquet  the csv columns, as part-NNNNN.parquet files in the output directory (needs pyarrow)
+#
+# Files are decoded in a process pool (--workers, default: all cores; 0 = in this process) and
+# results are written as they arrive, so memory use doesn't grow with the number of files.
+# Every finished file is committed to <output>.progress (<output>/_progress.jsonl for parquet);
+# --resume skips committed files and drops anything written after the last commit.
+import argparse
+import csv
+import fnmatch
+import glob
+import io
+import json
+import logging
+import mmap
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from main import BinCache, MapAnalysisError, MapDecoder, map_registry
+
+CSV_COLUMNS = ("file", "bin_id", "map", "row", "col", "x", "y", "value", "error")
+PARQUET_PART_ROWS = 500_000 # rows buffered before a part file is written
+PROGRESS_INTERVAL = 2.0 # seconds between progress lines on stderr
+
+worker_decoders = []
+
+
+def load_definitions(definitions_path, ecu_id, map_names):
+    if ecu_id:
+        definitions = [decoder.definition for decoder in map_registry.get_all(ecu_id)]
+    else:
+        with open(definitions_path) as f:
+            definitions = json.load(f)
+        if isinstance(definitions, dict):
+            definitions = definitions.get("maps", [definitions])
+        if not isinstance(definitions, list):
+            raise MapAnalysisError("Definitions must be a JSON array, a map definition or a {\"maps\": [...]} object.")
+    if map_names:
+        definitions = [map_def for map_def in definitions if isinstance(map_def, dict) and map_def.get("name") in map_names]
+        missing = set(map_names) - {map_def["name"] for map_def in definitions}
+        if missing:
+            raise MapAnalysisError(f"Maps not found in the definitions: {', '.join(sorted(missing))}")
+    for map_def in definitions:
+        try:
+            MapDecoder(map_def) # validate before starting the workers
+        except (TypeError, ValueError) as e:
+            raise MapAnalysisError(f"Invalid map definition: {e} ({map_def!r:.200})")
+    if not definitions:
+        raise MapAnalysisError("No map definitions to extract.")
+    return definitions
+
+
+def collect_inputs(inputs, pattern):
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for directory, _, names in os.walk(item):
+                paths.update(os.path.join(directory, name) for name in names if fnmatch.fnmatch(name.lower(), pattern.lower()))
+        elif os.path.isfile(item):
+            paths.add(item)
+        else:
+            paths.update(path for path in glob.glob(item, recursive=True) if os.path.isfile(path))
+    return sorted(os.path.abspath(path) for path in paths)
+
+
+def get_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet # noqa: F401
+    except ImportError:
+        raise MapAnalysisError("Parquet output needs pyarrow (pip install pyarrow).")
+    return pyarrow
+
+
+def get_parquet_schema(pyarrow):
+    return pyarrow.schema([
+        ("file", pyarrow.string()), ("bin_id", pyarrow.string()), ("map", pyarrow.string()),
+        ("row", pyarrow.int32()), ("col", pyarrow.int32()),
+        ("x", pyarrow.float64()), ("y", pyarrow.float64()), ("value", pyarrow.float64()),
+        ("error", pyarrow.string()),
+    ])
+
+
+def format_jsonl(path, bin_id, maps):
+    lines = []
+    for map_name, result, error in maps:
+        record = {"file": path, "bin_id": bin_id, "map": map_name}
+        if result is not None:
+            record.update({
+                "display_name": result["display_name"], "unit": result["unit"], "offset": result["offset"],
+                "x_axis": result["x_axis"], "y_axis": result["y_axis"], "values": result["map"],
+            })
+        record["error"] = error
+        lines.append(json.dumps(record, separators=(",", ":")))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def quote_csv_row(*fields):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(fields)
+    return buffer.getvalue()
+
+
+def format_csv(path, bin_id, maps):
+    # Same bytes as csv.writer, but the text fields are quoted once per map instead of once per cell
+    lines = []
+    for map_name, result, error in maps:
+        if result is None:
+            lines.append(quote_csv_row(path, bin_id, map_name, None, None, None, None, None, error))
+            continue
+        prefix = quote_csv_row(path, bin_id, map_name)[:-2]
+        x_axis = ["" if x is None else x for x in result["x_axis"]]
+        for row, (y, values) in enumerate(zip(result["y_axis"], result["map"])):
+            row_prefix = f"{prefix},{row},"
+            row_suffix = f",{'' if y is None else y},"
+            lines.extend(f"{row_prefix}{col},{x}{row_suffix}{'' if value is None else value},\r\n" for col, (x, value) in enumerate(zip(x_axis, values)))
+    return "".join(lines).encode()
+
+
+def format_parquet(path, bin_id, maps):
+    pyarrow = get_pyarrow()
+    columns = {name: [] for name in CSV_COLUMNS}
+    for map_name, result, error in maps:
+        if result is None:
+            for name, value in zip(CSV_COLUMNS, (path, bin_id, map_name, None, None, None, None, None, error)):
+                columns[name].append(value)
+            continue
+        rows, cols = len(result["map"]), len(result["x_axis"])
+        cells = rows * cols
+        columns["file"].extend([path] * cells)
+        columns["bin_id"].extend([bin_id] * cells)
+        columns["map"].extend([map_name] * cells)
+        columns["row"].extend(row for row in range(rows) for _ in range(cols))
+        columns["col"].extend(list(range(cols)) * rows)
+        columns["x"].extend(result["x_axis"] * rows)
+        columns["y"].extend(y for y in result["y_axis"] for _ in range(cols))
+        columns["value"].extend(value for values in result["map"] for value in values)
+        columns["error"].extend([None] * cells)
+    schema = get_parquet_schema(pyarrow)
+    return pyarrow.RecordBatch.from_arrays([pyarrow.array(columns[field.name], type=field.type) for field in schema], schema=schema)
+
+
+FORMATTERS = {"jsonl": format_jsonl, "csv": format_csv, "parquet": format_parquet}
+worker_formatter = None
+
+
+def init_worker(definitions, output_format, log_level):
+    global worker_formatter
+    logging.getLogger().setLevel(log_level)
+    worker_decoders[:] = [MapDecoder(map_def) for map_def in definitions]
+    worker_formatter = FORMATTERS[output_format]
+
+
+# Decode every map of one BIN and format the results in the worker, so the parent only writes them.
+# Returns (path, bin_id, number of maps with errors, formatted output)
+def extract_file(path):
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+    except OSError as e:
+        return path, None, 1, worker_formatter(path, None, [(None, None, f"Cannot read file: {e}")])
+    try:
+        maps = []
+        for decoder in worker_decoders:
+            try:
+                maps.append((decoder.name, decoder.decode(content), None))
+            except MapAnalysisError as e:
+                maps.append((decoder.name, None, e.message))
+        bin_id = BinCache.digest(content)
+    finally:
+        if size:
+            content.close()
+    return path, bin_id, sum(1 for _, _, error in maps if error), worker_formatter(path, bin_id, maps)
+
+
+def read_progress(progress_path):
+    entries = []
+    if os.path.exists(progress_path):
+        with open(progress_path) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break # partial last line from an interrupted run
+    return entries
+
+
+class FileOutput:
+    # JSONL/CSV file; each progress entry records the output size after that BIN's rows
+    def __init__(self, path, output_format, resume):
+        self.progress_path = path + ".progress"
+        entries = read_progress(self.progress_path) if resume else []
+        self.done = {entry["file"] for entry in entries}
+        self.file = open(path, "ab")
+        committed_size = entries[-1]["offset"] if entries else 0
+        if self.file.seek(0, os.SEEK_END) < committed_size:
+            raise MapAnalysisError(f"{path} is shorter than its progress file says. Use --overwrite to start again.")
+        self.file.truncate(committed_size)
+        self.file.seek(0, os.SEEK_END)
+        self.progress = open(self.progress_path, "a" if resume else "w")
+        if not entries:
+            self.progress.truncate(0)
+            if output_format == "csv":
+                self.file.write((",".join(CSV_COLUMNS) + "\r\n").encode())
+
+    def write(self, path, bin_id, data):
+        self.file.write(data)
+        self.file.flush()
+        self.progress.write(json.dumps({"file": path, "bin_id": bin_id, "offset": self.file.tell()}) + "\n")
+        self.progress.flush()
+
+    def close(self):
+        self.file.close()
+        self.progress.close()
+
+
+class ParquetOutput:
+    # Directory of part files; files are committed once the part holding their rows is written
+    def __init__(self, path, resume):
+        self.pyarrow = get_pyarrow()
+        self.schema = get_parquet_schema(self.pyarrow)
+        self.path = path
+        self.progress_path = os.path.join(path, "_progress.jsonl")
+        os.makedirs(path, exist_ok=True)
+        entries = read_progress(self.progress_path) if resume else []
+        self.done = {entry["file"] for entry in entries}
+        committed_parts = {entry["part"] for entry in entries}
+        # Parts not in the progress file were written by an interrupted run (or a run being replaced)
+        for name in os.listdir(path):
+            if name.startswith("part-") and name not in committed_parts:
+                os.remove(os.path.join(path, name))
+        self.part_number = len(committed_parts)
+        self.progress = open(self.progress_path, "a" if resume else "w")
+        self.batches = []
+        self.rows = 0
+        self.pending = [] # (path, bin_id) of files whose rows are buffered
+
+    def write(self, path, bin_id, batch):
+        self.batches.append(batch)
+        self.rows += batch.num_rows
+        self.pending.append((path, bin_id))
+        if self.rows >= PARQUET_PART_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        name = f"part-{self.part_number:05d}.parquet"
+        table = self.pyarrow.Table.from_batches(self.batches, schema=self.schema)
+        self.pyarrow.parquet.write_table(table, os.path.join(self.path, name + ".tmp"))
+        os.replace(os.path.join(self.path, name + ".tmp"), os.path.join(self.path, name))
+        self.progress.write("".join(json.dumps({"file": path, "bin_id": bin_id, "part": name}) + "\n" for path, bin_id in self.pending))
+        self.progress.flush()
+        self.part_number += 1
+        self.batches = []
+        self.rows = 0
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.progress.close()
+
+
+# Results in completion order, with at most `window` files in flight
+def run_pool(paths, definitions, output_format, workers, log_level):
+    if workers == 0:
+        init_worker(definitions, output_format, log_level)
+        yield from map(extract_file, paths)
+        return
+    window = workers * 4
+    remaining = iter(paths)
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(definitions, output_format, log_level)) as executor:
+        in_flight = set()
+        while True:
+            for path in remaining:
+                in_flight.add(executor.submit(extract_file, path))
+                if len(in_flight) >= window:
+                    break
+            if not in_flight:
+                return
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield future.result()
+
+
+def run(args):
+    # Decoding errors are recorded in the output; the decoder's log lines would repeat them per file
+    log_level = logging.INFO if args.verbose else logging.CRITICAL
+    logging.getLogger().setLevel(log_level)
+    output_format = args.format or ("csv" if args.output.endswith(".csv") else "jsonl" if args.output.endswith((".jsonl", ".json")) else "parquet")
+
+    try:
+        definitions = load_definitions(args.definitions, args.ecu_id, [name for name in (args.maps or "").split(",") if name])
+        if os.path.exists(args.output) and not (args.resume or args.overwrite):
+            raise MapAnalysisError(f"{args.output} already exists. Use --resume to continue it or --overwrite to replace it.")
+        output = ParquetOutput(args.output, args.resume) if output_format == "parquet" else FileOutput(args.output, output_format, args.resume)
+    except (MapAnalysisError, OSError, TypeError, ValueError) as e:
+        print(f"error: {getattr(e, 'message', e)}", file=sys.stderr)
+        return 2
+
+    paths = collect_inputs(args.inputs, args.pattern)
+    pending = [path for path in paths if path not in output.done]
+    print(f"{len(paths)} files, {len(paths) - len(pending)} already done, {len(definitions)} maps each -> {args.output} ({output_format})", file=sys.stderr)
+
+    started = last_report = time.perf_counter()
+    processed = failed_maps = 0
+    try:
+        for path, bin_id, errors, formatted in run_pool(pending, definitions, output_format, args.workers, log_level):
+            output.write(path, bin_id, formatted)
+            processed += 1
+            failed_maps += errors
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL:
+                print(f"{processed}/{len(pending)} files, {processed / (now - started):.0f} files/s", file=sys.stderr)
+                last_report = now
+    except KeyboardInterrupt:
+        print(f"Interrupted after {processed} files; run again with --resume to continue.", file=sys.stderr)
+        return 130
+    finally:
+        output.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Done: {processed} files in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.0f} files/s), {failed_maps} maps with errors.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract maps from many BIN files")
+    parser.add_argument("inputs", nargs="+", help="BIN files, directories or glob patterns")
+    definitions_group = parser.add_mutually_exclusive_group(required=True)
+    definitions_group.add_argument("--definitions", help="JSON file with the map definitions")
+    definitions_group.add_argument("--ecu-id", help="use the maps registered for this ECU in MAP_DEFINITIONS_DIR")
+    parser.add_argument("--maps", help="comma-separated map names to extract (default: all)")
+    parser.add_argument("-o", "--output", required=True, help="output file (.jsonl/.csv) or directory (parquet)")
+    parser.add_argument("--format", choices=("jsonl", "csv", "parquet"))
+    parser.add_argument("--pattern", default="*.bin", help="file name pattern inside directories (default: *.bin)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (0 = no pool)")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted run")
+    parser.add_argument("--overwrite", action="store_true", help="replace an existing output")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log the decoder's messages for every file")
+    sys.exit(run(parser.parse_args()))
@@ -0,0 +1,59 @@
+# Production server settings for the ECU Map Analyzer (gunicorn, threaded workers).
+#
+#   gunicorn -c gunicorn.conf.py main:app        (what render.yaml runs)
+#   APP_ENV=production python main.py            (same thing, started from main.py)
+#   python main.py                               (development: Werkzeug dev server + debugger)
+#
+# Every setting can be overridden through the environment variables below.
+#
+# Throughput measured with benchmarks/bench_server.py on a 1 vCPU sandbox (16 concurrent
+# clients, 4 MB BIN uploaded once, /analyze of a 32x32 16-bit map on its bin_id):
+#
+#   server                                   req/s   p50 ms   p99 ms   (+2 background /scan_maps)
+#   python main.py (dev server, debug=True)  ~710-810   19-22    31-37   465 req/s, p99 48 ms
+#   gunicorn, 2 workers x 4 threads          ~660-700   22-23    46-51   640 req/s, p99 53 ms
+#
+# With one core the two are on par for small cached requests; the gain shows once heavy
+# requests run alongside (the dev server lost ~40% throughput, gunicorn ~5%) and grows
+# with the number of cores, since each worker process has its own GIL. Production also
+# drops the Werkzeug debugger, which must never be reachable from the internet.
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+
+# Threaded workers: the heavy work is numpy/hashlib/zlib, which release the GIL.
+# The free plan has little RAM, so keep the process count low and scale with threads.
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", min(2, multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# Import the app (routes, config; numpy and the definition registry load lazily) once in the
+# master and fork it into workers
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+# Recycle workers now and then to keep memory in check on small instances
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+# Workers are separate processes with separate in-memory caches; a shared on-disk BIN
+# cache tier lets a bin_id uploaded to one worker be used from any other.
+if workers > 1:
+    os.environ.setdefault("BIN_CACHE_SPILL_DIR", "/tmp/ecu-bin-cache")
+
+
+# Warm each new worker up in the background (definition registry, numpy, first-call
+# code paths; see main.warm_up) so the first request after a cold start or a
+# max_requests recycle doesn't pay for it. /health waits for it if it's still running.
+def post_worker_init(worker):
+    import threading
+    import main
+    threading.Thread(target=main.warm_up, name="warm-up", daemon=True).start()
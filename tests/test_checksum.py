@@ -0,0 +1,123 @@
+# Checksum engine: incremental results (CRC checkpoints, additive sum deltas) must equal a
+# full recompute of the same image.
+#
+# Usage: python -m pytest tests/
+#
+# Saves are chained (each one patches the previous save's output) and branched (several
+# saves patch the same base), with written spans that overlap, repeat, touch each other and
+# share a sum word, as save_tuned_patch produces for neighbouring 8-bit cells.
+import binascii
+import os
+import random
+import sys
+import zlib
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import CHECKSUM_CHECKPOINT_SIZE, ChecksumDefinition, ChecksumEngine, crc16_arc_update  # noqa: E402
+
+IMAGE_SIZE = 3 * CHECKSUM_CHECKPOINT_SIZE + 1000
+ALGORITHMS = ["sum8", "sum16", "sum32", "crc32", "crc16_ccitt", "crc16_xmodem", "crc16_arc", "crc16_modbus"]
+
+
+def make_definitions(algorithm, endian):
+    # Two checksums: the second covers the whole image including where the first is stored
+    return [
+        ChecksumDefinition({"algorithm": algorithm, "ranges": [[0x100, 0x8000], [0x10000, IMAGE_SIZE - 0x400]], "storeAt": IMAGE_SIZE - 0x100, "endian": endian}, IMAGE_SIZE),
+        ChecksumDefinition({"algorithm": algorithm, "ranges": [[0, IMAGE_SIZE - 0x200]], "storeAt": IMAGE_SIZE - 0x80, "endian": endian}, IMAGE_SIZE),
+    ]
+
+
+def random_spans(rng):
+    spans = []
+    for _ in range(rng.randint(1, 6)):
+        start = rng.choice([rng.randrange(0x100, IMAGE_SIZE - 0x400), rng.randrange(0x100, 0x200), rng.randrange(0x10000, 0x10100)])
+        length = rng.choice([1, 1, 2, 3, 4, 7])
+        spans.append((start, length))
+        kind = rng.random()
+        if kind < 0.3:
+            spans.append((start, length)) # the same cell listed twice
+        elif kind < 0.6:
+            spans.append((start + length, rng.choice([1, 2]))) # adjacent, often in the same word
+        elif kind < 0.8:
+            spans.append((start + 1, length)) # overlapping
+    return spans
+
+
+def patched(content, spans, rng):
+    content = bytearray(content)
+    for start, length in spans:
+        content[start:start + length] = bytes(rng.getrandbits(8) for _ in range(length))
+    return content
+
+
+def values(results):
+    return [result["value"] for result in results]
+
+
+@pytest.mark.parametrize("endian", ["little", "big"])
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_incremental_matches_full_recompute(algorithm, endian):
+    rng = random.Random(f"{algorithm}{endian}")
+    engine = ChecksumEngine()
+    definitions = make_definitions(algorithm, endian)
+    base = bytearray(rng.getrandbits(8) for _ in range(IMAGE_SIZE))
+    _, base_digest = engine.apply(base, definitions)
+
+    incremental_seen = False
+    for _ in range(12):
+        # Chained saves, with two branches off each base
+        branches = []
+        for _ in range(2):
+            spans = random_spans(rng)
+            content = patched(base, spans, rng)
+            results, digest = engine.apply(content, definitions, base_digest, bytes(base), spans)
+            expected = bytearray(content)
+            expected_results, _ = ChecksumEngine().apply(expected, definitions)
+            assert values(results) == values(expected_results)
+            assert content == expected
+            incremental_seen = incremental_seen or any(result["incremental"] for result in results)
+            branches.append((content, digest))
+        base, base_digest = branches[rng.randrange(2)]
+    assert incremental_seen
+
+
+def test_two_8bit_cells_in_one_sum16_word():
+    # Second save against the same base, editing cells (0,0) and (0,1) of an 8-bit map
+    engine = ChecksumEngine()
+    definitions = [ChecksumDefinition({"algorithm": "sum16", "ranges": [[0, 0x1000]], "storeAt": 0x1000}, 0x1002)]
+    base = bytearray(range(256)) * 16 + bytearray(2)
+    _, base_digest = engine.apply(bytearray(base), definitions)
+    for values_written in (b"\x10\x20", b"\x99\x42"):
+        content = bytearray(base)
+        content[0x200:0x202] = values_written
+        results, _ = engine.apply(content, definitions, base_digest, bytes(base), [(0x200, 1), (0x201, 1)])
+        expected_results, _ = ChecksumEngine().apply(bytearray(content), definitions)
+        assert results[0]["incremental"] and values(results) == values(expected_results)
+
+
+@pytest.mark.parametrize("length", [0, 1, 31, 4096, 65536, 100003])
+@pytest.mark.parametrize("init", [0, 0xFFFF])
+def test_crc16_arc_matches_reference(length, init):
+    data = random.Random(length).randbytes(length)
+    crc = init
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    assert crc16_arc_update(memoryview(data), init) == crc
+    assert crc16_arc_update(b"123456789", 0) == 0xBB3D # CRC-16/ARC check value
+    assert crc16_arc_update(b"123456789", 0xFFFF) == 0x4B37 # CRC-16/MODBUS check value
+
+
+def test_crc_algorithms_match_zlib_and_binascii():
+    data = random.Random(7).randbytes(200000)
+    definition = ChecksumDefinition({"algorithm": "crc32", "ranges": [[0, len(data)]], "storeAt": 0}, len(data))
+    content = bytearray(data)
+    results, _ = ChecksumEngine().apply(content, [definition])
+    assert results[0]["value"] == hex(zlib.crc32(data))
+    definition = ChecksumDefinition({"algorithm": "crc16_ccitt", "ranges": [[4, len(data)]], "storeAt": 0}, len(data))
+    results, _ = ChecksumEngine().apply(bytearray(data), [definition])
+    assert results[0]["value"] == hex(binascii.crc_hqx(data[4:], 0xFFFF))
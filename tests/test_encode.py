@@ -0,0 +1,87 @@
+# Property test: the bulk map encoder must produce byte-identical output to the per-cell
+# loop save_tuned_bin used before it (legacy_encode_block below is a copy of that loop).
+#
+# Usage: python -m pytest tests/
+#
+# Every map format is checked against seeded random cases: None cells, out-of-range values,
+# exact .5 steps (round-half-even), signed and unsigned formats and factor 0. Half floats
+# and formats numpy can't describe go through encode_map_block_per_cell and are covered too.
+import os
+import random
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import encode_map_block  # noqa: E402
+
+CASES_PER_FORMAT = 300
+BULK_FORMATS = [("8bit", None), ("16bit", ">H"), ("16bit", "<H"), ("16bit", "<h"), ("16bit", ">h"), ("16bit", "H")]
+PER_CELL_FORMATS = [("16bit", ">e"), ("16bit", "<e"), ("16bit", "e"), ("16bit", "xB"), ("16bit", "Bx"), ("16bit", "2B")]
+
+
+def legacy_encode_block(values, original_block, data_type, endian, factor, offset_val):
+    content = bytearray(original_block)
+    byte_per_value = 2 if data_type == "16bit" else 1
+    for idx, tuned_value in enumerate(values):
+        if tuned_value is None:
+            raw_tuned_value = 0
+        elif factor == 0:
+            raw_tuned_value = 0
+        else:
+            raw_tuned_value = int(round((tuned_value - offset_val) / factor))
+            if data_type == "8bit":
+                raw_tuned_value = max(0, min(255, raw_tuned_value))
+            else:
+                raw_tuned_value = max(0, min(65535, raw_tuned_value))
+        start_idx = idx * byte_per_value
+        if data_type == "8bit":
+            content[start_idx] = raw_tuned_value
+        else:
+            try:
+                content[start_idx:start_idx + 2] = struct.pack(endian, raw_tuned_value)
+            except struct.error:
+                continue
+    return bytes(content)
+
+
+def random_case(rng, data_type, endian):
+    cells = rng.randint(1, 400)
+    factor = rng.choice([1, 0.1, 0.01, 0.0234, 1 / 3, 0.5, -0.25, 10, 0])
+    offset_val = rng.choice([0, -40, 0.5, 273.15, -5.0])
+    values = []
+    for _ in range(cells):
+        kind = rng.random()
+        if kind < 0.05:
+            values.append(None)
+        elif kind < 0.15:
+            values.append(rng.randint(-100000, 100000))
+        elif kind < 0.25:
+            # exact .5 steps exercise round-half-even
+            values.append((rng.randint(-600, 600) + 0.5) * (factor or 1) + offset_val)
+        else:
+            values.append(rng.uniform(-50, 700))
+    width = 2 if data_type == "16bit" else 1
+    original_block = bytes(rng.getrandbits(8) for _ in range(cells * width))
+    return values, original_block, data_type, endian, factor, offset_val
+
+
+@pytest.mark.parametrize("data_type, endian", BULK_FORMATS + PER_CELL_FORMATS)
+def test_bulk_encoder_matches_per_cell_loop(data_type, endian):
+    rng = random.Random(f"{data_type}{endian}")
+    for _ in range(CASES_PER_FORMAT):
+        case = random_case(rng, data_type, endian)
+        result = encode_map_block(*case)
+        assert result.block == legacy_encode_block(*case), f"encode mismatch for {case[2:]}"
+        assert result.none_cells == sum(value is None for value in case[0])
+
+
+@pytest.mark.parametrize("endian", [">e", "<e"])
+def test_half_float_overflow_keeps_original_bytes(endian):
+    # 65520 and up (70000 clamps to 65535) don't fit a half float; like the old loop, those cells keep their bytes
+    original_block = bytes(range(6))
+    result = encode_map_block([100, 65535, 70000], original_block, "16bit", endian, 1, 0)
+    assert result.block == struct.pack(endian, 100) + original_block[2:]
+    assert result.skipped_cells == 2 and result.clamped_cells == 1
@@ -0,0 +1,63 @@
+# Map auto-discovery: tables planted in random images must be found with their exact
+# block offset and shape, including tables whose first row keeps increasing past the
+# last y breakpoint (so the y axis and that row form one increasing run). Images made of
+# increasing runs end to end must still scan in bounded time.
+#
+# Usage: python -m pytest tests/
+import os
+import random
+import struct
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import scan_for_maps  # noqa: E402
+
+SEEDS = range(10)
+# label: (struct format, x axis, y axis, cell value at row i, column j)
+TABLES = {
+    "16bit_row_increasing": (">H", [500 + 250 * j for j in range(16)], [10 + 8 * i for i in range(12)], lambda i, j: 1000 + 30 * i + 20 * j),
+    "16bit_row_decreasing": (">H", [500 + 250 * j for j in range(16)], [10 + 8 * i for i in range(12)], lambda i, j: 1000 + 30 * i - 20 * j),
+    "16bit_le_row_increasing": ("<H", [100 * (j + 1) for j in range(8)], [20 * (i + 1) for i in range(8)], lambda i, j: 900 + 40 * i + 15 * j),
+    "8bit_row_increasing": ("B", [10 + 15 * j for j in range(12)], [5 + 10 * i for i in range(16)], lambda i, j: 60 + 5 * i + 8 * j),
+    "8bit_below_last_breakpoint": ("B", [10 * j for j in range(16)], [100 + 8 * i for i in range(16)], lambda i, j: 90 - 2 * i + j),
+}
+
+
+def plant(image, offset, fmt, x_axis, y_axis, cell):
+    values = x_axis + y_axis + [cell(i, j) for i in range(len(y_axis)) for j in range(len(x_axis))]
+    packed = b"".join(struct.pack(fmt, value) for value in values)
+    image[offset:offset + len(packed)] = packed
+    return offset + (len(x_axis) + len(y_axis)) * struct.calcsize(fmt)
+
+
+@pytest.mark.parametrize("label", TABLES)
+def test_scan_finds_planted_table(label):
+    fmt, x_axis, y_axis, cell = TABLES[label]
+    for seed in SEEDS:
+        rng = random.Random(seed)
+        image = bytearray(rng.getrandbits(8) for _ in range(64 * 1024))
+        block = plant(image, 0x4000 + rng.randrange(64) * 2, fmt, x_axis, y_axis, cell)
+        found = {candidate["block"]: candidate for candidate in scan_for_maps(bytes(image))}
+        assert block in found, f"seed {seed}: no candidate at {block:#x}, got {sorted(hex(b) for b in found)}"
+        candidate = found[block]
+        assert (candidate["rows"], candidate["cols"]) == (len(y_axis), len(x_axis)), f"seed {seed}: {candidate}"
+        assert candidate["endian"] == (None if fmt == "B" else fmt)
+        assert candidate["xAxisOffset"] == block - (len(x_axis) + len(y_axis)) * struct.calcsize(fmt)
+
+
+def test_scan_random_image_has_no_candidates():
+    rng = random.Random(1)
+    assert scan_for_maps(bytes(rng.getrandbits(8) for _ in range(256 * 1024))) == []
+
+
+def test_scan_sawtooth_image_is_bounded():
+    # Every 20-byte ramp is an increasing run, so each pair of neighbours is an axis candidate
+    image = bytes(i % 20 for i in range(1024 * 1024))
+    started = time.perf_counter()
+    candidates = scan_for_maps(image)
+    assert time.perf_counter() - started < 5
+    assert len(candidates) == 50